@@ -1,14 +1,86 @@
 from crewai import Agent, Task, Crew, LLM, Process
 import json
+import time
 from datetime import datetime
 import requests
-from database import ingredients_collection, recipes_collection
-from config import GROQ_API_KEY, TAVILY_API_KEY, DEFAULT_LLM_MODEL, LLAMA_MODEL TAVILY_SEARCH_DEPTH, TAVILY_INCLUDE_DOMAINS, \
-    TAVILY_MAX_RESULTS
+from models import Notes_Recipe
+from metrics import record_llm_call, record_validation_failure
+from config import GROQ_API_KEY, TAVILY_API_KEY, LLAMA_MODEL, AGENT_LLM_MODELS, FALLBACK_LLM_MODEL, \
+    TAVILY_SEARCH_DEPTH, TAVILY_INCLUDE_DOMAINS, TAVILY_MAX_RESULTS
 
 
-def get_llm():
-    return LLM(model=LLAMA_MODEL, api_key=GROQ_API_KEY)
+def get_model(stage=None):
+    return AGENT_LLM_MODELS.get(stage, LLAMA_MODEL)
+
+
+def get_llm(model):
+    return LLM(model=model, api_key=GROQ_API_KEY)
+
+
+def _kickoff(stage, model, build_crew):
+    crew = build_crew(get_llm(model))
+    start = time.perf_counter()
+    try:
+        result = crew.kickoff()
+    except Exception:
+        record_llm_call(stage, model, time.perf_counter() - start, failed=True)
+        raise
+    record_llm_call(stage, model, time.perf_counter() - start, getattr(result, "token_usage", None))
+    return result
+
+
+def run_stage(stage, build_crew, parse=None, lenient_parse=None):
+    """Kick off the crew for `stage` on its configured model.
+
+    `build_crew` takes an LLM and returns a Crew. If `parse` is given it must turn the
+    crew output into validated data or raise; when that fails on a smaller model the
+    stage is rerun once on FALLBACK_LLM_MODEL. Output from FALLBACK_LLM_MODEL goes
+    through `lenient_parse` instead when one is given.
+    """
+    model = get_model(stage)
+    result = _kickoff(stage, model, build_crew)
+    if parse is None:
+        return result
+    lenient_parse = lenient_parse or parse
+    if model != FALLBACK_LLM_MODEL:
+        try:
+            return parse(result)
+        except Exception:
+            record_validation_failure(stage, model)
+        result = _kickoff(stage, FALLBACK_LLM_MODEL, build_crew)
+    try:
+        return lenient_parse(result)
+    except Exception:
+        record_validation_failure(stage, FALLBACK_LLM_MODEL)
+        raise
+
+
+def parse_json_output(result):
+    data = result.raw
+    if isinstance(data, str):
+        if "```json" in data:
+            json_start = data.find("```json") + 7
+            json_end = data.rfind("```")
+            data = data[json_start:json_end]
+        data = json.loads(data.strip())
+    return data
+
+
+def parse_recipe(result):
+    try:
+        recipe_data = parse_json_output(result)
+    except json.JSONDecodeError:
+        raise ValueError(f"Could not parse as JSON: {result.raw}")
+    if not isinstance(recipe_data, dict):
+        raise ValueError(f"Unexpected output format: {type(recipe_data)}")
+    if 'ingredients' in recipe_data and 'items' not in recipe_data:
+        recipe_data['items'] = recipe_data.pop('ingredients')
+
+    if 'steps' in recipe_data and 'instructions' not in recipe_data:
+        recipe_data['instructions'] = recipe_data.pop('steps')
+
+    Notes_Recipe(**{**recipe_data, "is_recipe": True, "is_fav": False})
+    return recipe_data
 
 
 def tavily_search(query):
@@ -28,38 +100,37 @@ def tavily_search(query):
 
 
 def check_dietary_restrictions():
-    llm = get_llm()
-
-    cultural_researcher = Agent(
-        role="Cultural Food Researcher",
-        goal="Identify current festivals and associated dietary restrictions.",
-        backstory="An expert in cultural food practices and dietary restrictions related to Hindu festivals and holidays. Avoid beef and pork",
-        verbose=False,
-        llm=llm
-    )
-
     today = datetime.now().strftime("%B %d")
 
     search_results = tavily_search(f"dietary restrictions or food restrictions during {today} festivals or holidays")
     search_content = "\n".join([result.get("content", "") for result in search_results.get("results", [])])
 
-    research_task = Task(
-        description=(
-            f"Today is {today}. Based on the following search results, identify any religious or cultural festivals related to hinduism."
-            f"occurring today and their associated dietary restrictions:\n{search_content}\n"
-            "Focus on restrictions related to vegetarianism, beef, pork, or other significant food restrictions."
-        ),
-        expected_output="A list of dietary restrictions in JSON format with each restriction as a string.",
-        agent=cultural_researcher
-    )
+    def build_crew(llm):
+        cultural_researcher = Agent(
+            role="Cultural Food Researcher",
+            goal="Identify current festivals and associated dietary restrictions.",
+            backstory="An expert in cultural food practices and dietary restrictions related to Hindu festivals and holidays. Avoid beef and pork",
+            verbose=False,
+            llm=llm
+        )
 
-    crew = Crew(
-        agents=[cultural_researcher],
-        tasks=[research_task],
-        verbose=False,
-    )
+        research_task = Task(
+            description=(
+                f"Today is {today}. Based on the following search results, identify any religious or cultural festivals related to hinduism."
+                f"occurring today and their associated dietary restrictions:\n{search_content}\n"
+                "Focus on restrictions related to vegetarianism, beef, pork, or other significant food restrictions."
+            ),
+            expected_output="A list of dietary restrictions in JSON format with each restriction as a string.",
+            agent=cultural_researcher
+        )
 
-    result = crew.kickoff()
+        return Crew(
+            agents=[cultural_researcher],
+            tasks=[research_task],
+            verbose=False,
+        )
+
+    result = run_stage("dietary_research", build_crew)
 
     try:
         restrictions = result.raw
@@ -71,9 +142,7 @@ def check_dietary_restrictions():
         return []
 
 
-def create_recipe_crew(recipe_type, ingredients):
-    llm = get_llm()
-
+def create_recipe_crew(recipe_type, ingredients, dietary_restrictions, llm):
     # Initialize agents
     recipe_creator = Agent(
         role="Recipe Creator",
@@ -107,16 +176,6 @@ def create_recipe_crew(recipe_type, ingredients):
         llm=llm
     )
 
-    recipe_formatter = Agent(
-        role="Recipe Formatter",
-        goal="Format recipes into clear, structured instructions.",
-        backstory="A technical writer specializing in recipe documentation and formatting.",
-        verbose=False,
-        llm=llm
-    )
-
-    dietary_restrictions = check_dietary_restrictions()
-
     ingredient_list = [f"{item['name']} ({item['quantity']})" for item in ingredients]
 
     if recipe_type == 1:
@@ -143,15 +202,9 @@ def create_recipe_crew(recipe_type, ingredients):
             agent=nutritionist
         )
 
-        format_task = Task(
-            description="Format the recipe into a clear JSON structure with name, is_veg (boolean), ingredients (list of strings), and steps (list of strings).",
-            expected_output="A formatted recipe in JSON format.",
-            agent=recipe_formatter
-        )
-
         return Crew(
-            agents=[food_pairing_expert, recipe_creator, nutritionist, recipe_formatter],
-            tasks=[pairing_task, recipe_task, nutrition_task, format_task],
+            agents=[food_pairing_expert, recipe_creator, nutritionist],
+            tasks=[pairing_task, recipe_task, nutrition_task],
             verbose=False,
             process=Process.sequential
         )
@@ -179,15 +232,9 @@ def create_recipe_crew(recipe_type, ingredients):
             agent=nutritionist
         )
 
-        format_task = Task(
-            description="Format the recipe into a clear JSON structure with name, is_veg (boolean), ingredients (list of strings), and steps (list of strings).",
-            expected_output="A formatted recipe in JSON format.",
-            agent=recipe_formatter
-        )
-
         return Crew(
-            agents=[food_pairing_expert, recipe_creator, nutritionist, recipe_formatter],
-            tasks=[suggest_task, recipe_task, nutrition_task, format_task],
+            agents=[food_pairing_expert, recipe_creator, nutritionist],
+            tasks=[suggest_task, recipe_task, nutrition_task],
             verbose=False,
             process=Process.sequential
         )
@@ -216,46 +263,76 @@ def create_recipe_crew(recipe_type, ingredients):
             agent=nutritionist
         )
 
-        format_task = Task(
-            description="Format the recipe into a clear JSON structure with name, is_veg (boolean), ingredients (list of strings), and steps (list of strings).",
-            expected_output="A formatted recipe in JSON format.",
-            agent=recipe_formatter
-        )
-
         return Crew(
-            agents=[web_researcher, recipe_creator, nutritionist, recipe_formatter],
-            tasks=[search_task, recipe_task, nutrition_task, format_task],
+            agents=[web_researcher, recipe_creator, nutritionist],
+            tasks=[search_task, recipe_task, nutrition_task],
             verbose=False,
             process=Process.sequential
         )
 
 
-def get_recipe_suggestions(ingredients):
-    llm = get_llm()
-
-    suggestion_agent = Agent(
-        role="Recipe Suggestion Expert",
-        goal="Suggest recipe ideas based on available ingredients.",
-        backstory="A culinary expert who specializes in creating recipe ideas from available ingredients.",
+def create_format_crew(recipe, llm):
+    recipe_formatter = Agent(
+        role="Recipe Formatter",
+        goal="Format recipes into clear, structured instructions.",
+        backstory="A technical writer specializing in recipe documentation and formatting.",
         verbose=False,
         llm=llm
     )
 
-    ingredient_list = [item['name'] for item in ingredients]
-
-    suggestion_task = Task(
-        description=f"Suggest 5 recipe ideas using some or all of these ingredients: {', '.join(ingredient_list)}",
-        expected_output="A list of 5 recipe ideas in JSON format with name and brief description.",
-        agent=suggestion_agent
+    format_task = Task(
+        description=(
+            f"Format the following recipe into a clear JSON structure with name, is_veg (boolean), ingredients (list of strings), and steps (list of strings):\n{recipe}"
+        ),
+        expected_output="A formatted recipe in JSON format.",
+        agent=recipe_formatter
     )
 
-    crew = Crew(
-        agents=[suggestion_agent],
-        tasks=[suggestion_task],
+    return Crew(
+        agents=[recipe_formatter],
+        tasks=[format_task],
         verbose=False
     )
 
-    result = crew.kickoff()
+
+def generate_recipe(recipe_type, ingredients):
+    dietary_restrictions = check_dietary_restrictions()
+
+    result = run_stage(
+        "recipe_creation",
+        lambda llm: create_recipe_crew(recipe_type, ingredients, dietary_restrictions, llm)
+    )
+    # The formatter only needs the recipe and the nutritionist's revisions
+    recipe = "\n\n".join(output.raw for output in result.tasks_output[-2:])
+
+    return run_stage("recipe_formatting", lambda llm: create_format_crew(recipe, llm), parse=parse_recipe)
+
+
+def get_recipe_suggestions(ingredients):
+    ingredient_list = [item['name'] for item in ingredients]
+
+    def build_crew(llm):
+        suggestion_agent = Agent(
+            role="Recipe Suggestion Expert",
+            goal="Suggest recipe ideas based on available ingredients.",
+            backstory="A culinary expert who specializes in creating recipe ideas from available ingredients.",
+            verbose=False,
+            llm=llm
+        )
+
+        suggestion_task = Task(
+            description=f"Suggest 5 recipe ideas using some or all of these ingredients: {', '.join(ingredient_list)}",
+            expected_output="A list of 5 recipe ideas in JSON format with name and brief description.",
+            agent=suggestion_agent
+        )
+
+        return Crew(
+            agents=[suggestion_agent],
+            tasks=[suggestion_task],
+            verbose=False
+        )
+
+    result = run_stage("recipe_suggestion", build_crew)
 
     try:
         if hasattr(result, 'raw'):
@@ -8,6 +8,11 @@ MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = "recipe_ai"
 INGREDIENTS_COLLECTION = "ingredients"
 RECIPES_COLLECTION = "recipes"
+PANTRY_META_COLLECTION = "pantry_meta"
+
+# Pantry snapshot sync
+PANTRY_CHANGE_LOG_SIZE = 500
+PANTRY_POLL_INTERVAL = 2  # seconds, used when change streams are unavailable
 
 # API Keys
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -17,6 +22,19 @@ TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 DEFAULT_LLM_MODEL = "groq/gemma2-9b-it"
 LLAMA_MODEL = "groq/llama-3.3-70b-versatile"
 
+# Model used for each agent stage. Stages that only reshape or label data run on
+# the small model; anything that has to reason stays on the large one.
+AGENT_LLM_MODELS = {
+    "dietary_research": LLAMA_MODEL,
+    "recipe_creation": LLAMA_MODEL,
+    "recipe_formatting": DEFAULT_LLM_MODEL,
+    "recipe_suggestion": LLAMA_MODEL,
+    "invoice_extraction": LLAMA_MODEL,
+    "invoice_classification": DEFAULT_LLM_MODEL,
+}
+# Stages whose output fails schema validation are rerun once on this model
+FALLBACK_LLM_MODEL = LLAMA_MODEL
+
 # Tavily search configuration
 TAVILY_SEARCH_DEPTH = "advanced"
 TAVILY_INCLUDE_DOMAINS = [
@@ -1,10 +1,50 @@
 from crewai import Agent, Task, Crew, Process
 import json
 import io
+import re
 import pdfplumber
 from datetime import date
-from database import ingredients_collection
-from chef import get_llm
+from models import Ingredients
+from pantry import upsert_ingredients
+from chef import run_stage, parse_json_output
+
+
+def coerce_quantity(quantity):
+    # Invoices list things like "2 kg" or "1,500"; the pantry only tracks whole units
+    if isinstance(quantity, str):
+        match = re.search(r"\d+(\.\d+)?", quantity.replace(",", ""))
+        if not match:
+            raise ValueError(f"Invalid quantity: {quantity}")
+        quantity = float(match.group())
+    if isinstance(quantity, float):
+        if round(quantity) < 1:
+            raise ValueError(f"Invalid quantity: {quantity}")
+        quantity = round(quantity)
+    return quantity
+
+
+# Returns (items, skipped_count). Strict mode raises on any invalid or missing item so
+# the stage falls back to the large model; lenient mode skips and counts them instead.
+def parse_items(result, expected_count, strict=True):
+    items = parse_json_output(result)
+    if not isinstance(items, list):
+        raise ValueError("Invalid output format from CrewAI")
+    if strict and len(items) < expected_count:
+        raise ValueError(f"Expected {expected_count} items, got {len(items)}")
+
+    valid_items = []
+    for item in items:
+        try:
+            item = dict(item)
+            item["quantity"] = coerce_quantity(item.get("quantity"))
+            valid_items.append(Ingredients(**item).dict())
+        except (TypeError, ValueError) as e:
+            if strict:
+                raise
+            print(f"Skipping invalid invoice item {item}: {str(e)}")
+    if items and not valid_items:
+        raise ValueError("No valid items in CrewAI output")
+    return valid_items, max(0, expected_count - len(valid_items))
 
 
 def process_invoice_pdf(file_data):
@@ -16,11 +56,10 @@ def process_invoice_pdf(file_data):
         if not extracted_text.strip():
             return {"error": "No text extracted from the invoice."}
 
-        llm = get_llm()
-
-        extractor = Agent(
-            role="Food Invoice Data Extractor",
-            goal="""Extract only food-related items (product titles/names/descriptions) and quantities from invoices with 100% accuracy, ensuring consistency and removing brand-specific information.
+        def build_extract_crew(llm):
+            extractor = Agent(
+                role="Food Invoice Data Extractor",
+                goal="""Extract only food-related items (product titles/names/descriptions) and quantities from invoices with 100% accuracy, ensuring consistency and removing brand-specific information.
 
 Instructions:
 
@@ -29,94 +68,78 @@ Generalize item names by removing brand names and ensuring uniformity.
 If the same product appears with different descriptions (e.g., Kashmir Apple vs. Apple), standardize it to the most general form (Apple).
 Avoid duplicate entries due to slight naming variations (e.g., Chips Lay's India's Magic Masala and Lay's India's Magic Masala Potato Chips should both be recognized as Magic Masala Chips).
 Ensure structured and accurate extraction with no irrelevant data.""",
-            backstory="An AI expert in parsing invoices with a specialized focus on food-related items. It intelligently identifies and standardizes item names while maintaining data integrity.",
-            verbose=False,
-            llm=llm
-        )
-
-        classifier = Agent(
-            role="Food Classifier",
-            goal="Classify food items as fruits/vegetables or other food categories.",
-            backstory="An expert in food classification with deep knowledge of ingredients and food categories.",
-            verbose=False,
-            llm=llm
-        )
-
-        data_formatter = Agent(
-            role="Data Formatter",
-            goal="Format extracted data into consistent JSON structure.",
-            backstory="An expert in data standardization and formatting with attention to detail.",
-            verbose=False,
-            llm=llm
-        )
-
-        extract_task = Task(
-            description=(
-                f"Extract only **food-related** items from the following invoice text:\n{extracted_text}\n"
-                "Focus on extracting details such as **product name/title** and **quantity**. "
-                "Ignore non-food-related entries such as electronics, furniture, or services. "
-            ),
-            expected_output="A list where each object contains: `name` (product title) and `quantity` (numeric).",
-            agent=extractor
-        )
-
-        extract_crew = Crew(
-            agents=[extractor],
-            tasks=[extract_task],
-            verbose=False,
-            process=Process.sequential
-        )
-
-        initial_result = extract_crew.kickoff()
-
-        try:
-            extracted_items = initial_result.raw
-
-            if isinstance(extracted_items, str):
-                extracted_items = json.loads(extracted_items)
-
-            if not isinstance(extracted_items, list):
-                return {"error": "Invalid output format from CrewAI"}
-
-            classify_task = Task(
-                description=(
-                    f"Classify each food item as a fruit/vegetable (true) or other food (false):\n{json.dumps(extracted_items)}"
-                ),
-                expected_output="A list where each object contains: `name` (product title), `quantity` (numeric), `is_vegetable_or_fruit` (boolean).",
-                agent=classifier
+                backstory="An AI expert in parsing invoices with a specialized focus on food-related items. It intelligently identifies and standardizes item names while maintaining data integrity.",
+                verbose=False,
+                llm=llm
             )
 
-            format_task = Task(
+            extract_task = Task(
                 description=(
-                    "Format the classified data into a consistent JSON structure with properly named fields."
+                    f"Extract only **food-related** items from the following invoice text:\n{extracted_text}\n"
+                    "Focus on extracting details such as **product name/title** and **quantity**. "
+                    "Ignore non-food-related entries such as electronics, furniture, or services. "
                 ),
-                expected_output="A list where each object contains: `name` (product title), `quantity` (numeric), `is_vegetable_or_fruit` (boolean).",
-                agent=data_formatter
+                expected_output="A list where each object contains: `name` (product title) and `quantity` (numeric).",
+                agent=extractor
             )
 
-            classification_crew = Crew(
-                agents=[classifier, data_formatter],
-                tasks=[classify_task, format_task],
+            return Crew(
+                agents=[extractor],
+                tasks=[extract_task],
                 verbose=False,
                 process=Process.sequential
             )
 
-            classification_result = classification_crew.kickoff()
-            final_data = classification_result.raw
+        initial_result = run_stage("invoice_extraction", build_extract_crew)
+
+        try:
+            extracted_items = parse_json_output(initial_result)
 
-            if isinstance(final_data, str):
-                final_data = json.loads(final_data)
+            if not isinstance(extracted_items, list):
+                return {"error": "Invalid output format from CrewAI"}
 
-            today = date.today()
-            for item in final_data:
-                item["itemAdded"] = today.isoformat()
-                ingredients_collection.update_one(
-                    {"name": item["name"]},
-                    {"$set": item},
-                    upsert=True
+            def build_classify_crew(llm):
+                classifier = Agent(
+                    role="Food Classifier",
+                    goal="Classify food items as fruits/vegetables or other food categories.",
+                    backstory="An expert in food classification with deep knowledge of ingredients and food categories.",
+                    verbose=False,
+                    llm=llm
+                )
+
+                classify_task = Task(
+                    description=(
+                        f"Classify each food item as a fruit/vegetable (true) or other food (false):\n{json.dumps(extracted_items)}"
+                    ),
+                    expected_output="A list where each object contains: `name` (product title), `quantity` (numeric), `is_vegetable_or_fruit` (boolean).",
+                    agent=classifier
                 )
 
-            return {"success": True, "items_processed": len(final_data), "items": final_data}
+                return Crew(
+                    agents=[classifier],
+                    tasks=[classify_task],
+                    verbose=False,
+                    process=Process.sequential
+                )
+
+            classified_items, skipped_count = run_stage(
+                "invoice_classification",
+                build_classify_crew,
+                parse=lambda result: parse_items(result, len(extracted_items)),
+                lenient_parse=lambda result: parse_items(result, len(extracted_items), strict=False)
+            )
+
+            today = date.today()
+            for item in classified_items:
+                item["itemAdded"] = today.isoformat()
+            upsert_ingredients(classified_items)
+
+            return {
+                "success": True,
+                "items_processed": len(classified_items),
+                "items_skipped": skipped_count,
+                "items": classified_items
+            }
 
         except Exception as e:
             return {"error": f"Data processing error: {str(e)}"}
@@ -3,6 +3,7 @@ from flask_cors import CORS
 from routes.invoice_routes import invoice_bp
 from routes.ingredient_routes import ingredient_bp
 from routes.recipe_routes import recipe_bp
+from routes.metrics_routes import metrics_bp
 from database import JSONEncoder
 
 app = Flask(__name__)
@@ -13,6 +14,7 @@ app.json_encoder = JSONEncoder
 app.register_blueprint(invoice_bp, url_prefix='/api')
 app.register_blueprint(ingredient_bp, url_prefix='/api')
 app.register_blueprint(recipe_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
 
 app.get("/")(lambda: "Welcome to the Recipe API!")
 
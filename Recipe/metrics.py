@@ -0,0 +1,46 @@
+import threading
+
+_lock = threading.Lock()
+llm_metrics = {}
+
+
+def _stats(role, model):
+    return llm_metrics.setdefault(role, {}).setdefault(model, {
+        "calls": 0,
+        "failed_calls": 0,
+        "validation_failures": 0,
+        "total_seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0
+    })
+
+
+def record_llm_call(role, model, elapsed, token_usage=None, failed=False):
+    with _lock:
+        stats = _stats(role, model)
+        stats["calls"] += 1
+        if failed:
+            stats["failed_calls"] += 1
+        stats["total_seconds"] += elapsed
+        if token_usage is not None:
+            stats["prompt_tokens"] += getattr(token_usage, "prompt_tokens", 0)
+            stats["completion_tokens"] += getattr(token_usage, "completion_tokens", 0)
+            stats["total_tokens"] += getattr(token_usage, "total_tokens", 0)
+
+
+def record_validation_failure(role, model):
+    with _lock:
+        _stats(role, model)["validation_failures"] += 1
+
+
+def get_llm_metrics():
+    with _lock:
+        metrics = {}
+        for role, models in llm_metrics.items():
+            metrics[role] = {}
+            for model, stats in models.items():
+                stats = dict(stats)
+                stats["avg_seconds"] = stats["total_seconds"] / stats["calls"] if stats["calls"] else 0.0
+                metrics[role][model] = stats
+        return metrics
@@ -0,0 +1,163 @@
+# In-memory pantry snapshot kept in sync across workers. Every write through this
+# module bumps a version counter in pantry_meta and logs the ids it touched on the
+# same document. Workers watch that document with a change stream (or poll it when
+# the server is not a replica set) and refetch only the ingredients they missed.
+import threading
+import time
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+from database import ingredients_collection, pantry_meta_collection
+from config import PANTRY_CHANGE_LOG_SIZE, PANTRY_POLL_INTERVAL
+
+PANTRY_META_ID = "ingredients"
+
+# (version, {ingredient id: ingredient}), replaced wholesale on every update
+_state = None
+_sync_lock = threading.Lock()
+_start_lock = threading.Lock()
+_listener = None
+
+
+def _serialize(ingredient):
+    ingredient['_id'] = str(ingredient['_id'])
+    return ingredient
+
+
+def _reload():
+    global _state
+    meta = pantry_meta_collection.find_one({"_id": PANTRY_META_ID}) or {}
+    ingredients = {str(doc['_id']): _serialize(doc) for doc in ingredients_collection.find()}
+    _state = (meta.get("version", 0), ingredients)
+
+
+def _apply(meta):
+    global _state
+    with _sync_lock:
+        version, ingredients = _state
+        new_version = meta.get("version", 0)
+        if new_version <= version:
+            return
+
+        # One log entry per version, newest last
+        changes = meta.get("changes", [])
+        missed = new_version - version
+        pending = changes[len(changes) - missed:]
+        # Fell behind the log, or someone edited it by hand
+        if missed > len(changes) or not all(isinstance(change.get("ids"), list) for change in pending):
+            _reload()
+            return
+
+        ids = {_id for change in pending for _id in change["ids"]}
+        ingredients = dict(ingredients)
+        for _id in ids:
+            ingredients.pop(str(_id), None)
+        for doc in ingredients_collection.find({"_id": {"$in": list(ids)}}):
+            ingredients[str(doc['_id'])] = _serialize(doc)
+        _state = (new_version, ingredients)
+
+
+def _sync():
+    meta = pantry_meta_collection.find_one({"_id": PANTRY_META_ID})
+    if meta:
+        _apply(meta)
+
+
+def _record_change(ids):
+    meta = pantry_meta_collection.find_one_and_update(
+        {"_id": PANTRY_META_ID},
+        {
+            "$inc": {"version": 1},
+            "$push": {"changes": {"$each": [{"ids": list(ids)}], "$slice": -PANTRY_CHANGE_LOG_SIZE}}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    # The write already succeeded; the listener catches up if this refresh fails
+    try:
+        _apply(meta)
+    except Exception as e:
+        print(f"Failed to refresh pantry snapshot: {str(e)}")
+
+
+def _listen():
+    while True:
+        try:
+            with pantry_meta_collection.watch(
+                [{"$match": {"documentKey._id": PANTRY_META_ID}}],
+                full_document="updateLookup"
+            ) as stream:
+                # Catch anything written before the stream was opened
+                _sync()
+                for change in stream:
+                    if change.get("fullDocument"):
+                        _apply(change["fullDocument"])
+        except OperationFailure as e:
+            print(f"Pantry change stream unavailable, polling instead: {str(e)}")
+            break
+        except Exception as e:
+            print(f"Pantry change stream interrupted: {str(e)}")
+            time.sleep(PANTRY_POLL_INTERVAL)
+
+    while True:
+        time.sleep(PANTRY_POLL_INTERVAL)
+        try:
+            _sync()
+        except Exception as e:
+            print(f"Failed to poll pantry version: {str(e)}")
+
+
+def _ensure_started():
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    with _start_lock:
+        if _listener is None or not _listener.is_alive():
+            _reload()
+            _listener = threading.Thread(target=_listen, name="pantry-sync", daemon=True)
+            _listener.start()
+
+
+# The version changes whenever the pantry does, so it doubles as a cache key / ETag
+def get_snapshot():
+    _ensure_started()
+    version, ingredients = _state
+    # Sorted by _id so every worker returns the same body for the same version
+    return version, [dict(ingredients[_id]) for _id in sorted(ingredients)]
+
+
+def get_version():
+    _ensure_started()
+    return _state[0]
+
+
+def upsert_ingredients(items):
+    _ensure_started()
+    ids = []
+    try:
+        for item in items:
+            doc = ingredients_collection.find_one_and_update(
+                {"name": item["name"]},
+                {"$set": item},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            ids.append(doc['_id'])
+    except Exception:
+        # Log whatever made it to Mongo before the failure, without hiding it
+        if ids:
+            try:
+                _record_change(ids)
+            except Exception as e:
+                print(f"Failed to record pantry change: {str(e)}")
+        raise
+    if ids:
+        _record_change(ids)
+
+
+def delete_ingredient(ingredient_id):
+    result = ingredients_collection.delete_one({"_id": ingredient_id})
+    if result.deleted_count == 0:
+        return False
+    _ensure_started()
+    _record_change([ingredient_id])
+    return True
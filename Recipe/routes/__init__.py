@@ -0,0 +1,16 @@
+from flask import request, jsonify
+
+
+def pantry_etag(version):
+    return f"pantry-{version}"
+
+
+def pantry_not_modified(version):
+    # Same weak comparison make_conditional uses for If-None-Match
+    return request.if_none_match.contains_weak(pantry_etag(version))
+
+
+def pantry_response(version, data, weak=False):
+    response = jsonify(data)
+    response.set_etag(pantry_etag(version), weak=weak)
+    return response.make_conditional(request)
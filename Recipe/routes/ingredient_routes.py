@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta, date
 from models import Ingredients
-from database import ingredients_collection
+from pantry import get_snapshot, upsert_ingredients, delete_ingredient as delete_pantry_ingredient
 from config import FOOD_EXPIRY_DAYS
+from routes import pantry_response
 
 ingredient_bp = Blueprint('ingredient', __name__)
 
@@ -16,11 +17,7 @@ def add_ingredient():
         if isinstance(item_dict['itemAdded'], date):
             item_dict['itemAdded'] = item_dict['itemAdded'].isoformat()
             
-        ingredients_collection.update_one(
-            {"name": item.name},
-            {"$set": item_dict},
-            upsert=True
-        )
+        upsert_ingredients([item_dict])
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -29,11 +26,8 @@ def add_ingredient():
 @ingredient_bp.route('/get-ingredients', methods=['GET'])
 def get_ingredients():
     try:
-        ingredients = list(ingredients_collection.find())
-        for ingredient in ingredients:
-            if '_id' in ingredient:
-                ingredient['_id'] = str(ingredient['_id'])
-        return jsonify(ingredients)
+        version, ingredients = get_snapshot()
+        return pantry_response(version, ingredients)
     except Exception as e:
         return jsonify({"error": f"Error fetching ingredients: {str(e)}"}), 500
 
@@ -42,14 +36,15 @@ def get_ingredients():
 def get_expiring_ingredients():
     try:
         expiry_days_ago = datetime.now() - timedelta(days=FOOD_EXPIRY_DAYS)
-        expiring = list(ingredients_collection.find({
-            "itemAdded": {"$lte": expiry_days_ago.date().isoformat()},
-            "is_vegetable_or_fruit": True
-        }))
-        for ingredient in expiring:
-            if '_id' in ingredient:
-                ingredient['_id'] = str(ingredient['_id'])
-        return jsonify(expiring)
+        cutoff = expiry_days_ago.date().isoformat()
+        version, ingredients = get_snapshot()
+        expiring = [
+            ingredient for ingredient in ingredients
+            if ingredient.get("is_vegetable_or_fruit") is True
+            and isinstance(ingredient.get("itemAdded"), str) and ingredient["itemAdded"] <= cutoff
+        ]
+        # The expiry cutoff moves daily, so it is part of the ETag as well
+        return pantry_response(f"{version}-{cutoff}", expiring)
     except Exception as e:
         return jsonify({"error": f"Error fetching expiring ingredients: {str(e)}"}), 500
 
@@ -58,8 +53,7 @@ def get_expiring_ingredients():
 def delete_ingredient(ingredient_id):
     try:
         from bson import ObjectId
-        result = ingredients_collection.delete_one({"_id": ObjectId(ingredient_id)})
-        if result.deleted_count == 0:
+        if not delete_pantry_ingredient(ObjectId(ingredient_id)):
             return jsonify({"error": "Ingredient not found"}), 404
         return jsonify({"success": True, "message": "Ingredient deleted successfully"})
     except Exception as e:
@@ -0,0 +1,9 @@
+from flask import Blueprint, jsonify
+from metrics import get_llm_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/llm-metrics', methods=['GET'])
+def llm_metrics():
+    return jsonify(get_llm_metrics())
@@ -1,52 +1,29 @@
+import threading
 from flask import Blueprint, request, jsonify
 from models import Notes_Recipe
-from database import ingredients_collection, recipes_collection
-from chef import create_recipe_crew, get_recipe_suggestions
-import json
+from database import recipes_collection
+from chef import generate_recipe, get_recipe_suggestions
+from pantry import get_snapshot
+from routes import pantry_not_modified, pantry_response
 
 recipe_bp = Blueprint('recipe', __name__)
 
+# (pantry version, suggestions) for the newest pantry seen by this worker
+_suggestions = None
+_suggestions_lock = threading.Lock()
+
 
 @recipe_bp.route('/get-recipe', methods=['POST'])
 def get_recipe():
     data = request.json
     recipe_type = data.get('type', 1)  # 1, 2, or 3
 
-    ingredients = list(ingredients_collection.find())
+    _, ingredients = get_snapshot()
     if not ingredients and recipe_type != 3:
         return jsonify({"error": "No ingredients available"}), 400
 
     try:
-        crew = create_recipe_crew(recipe_type, ingredients)
-        result = crew.kickoff()
-        if hasattr(result, 'raw'):
-            recipe_data = result.raw
-        elif hasattr(result, 'json_dict'):
-            recipe_data = result.json_dict
-        else:
-            recipe_data = str(result)
-        if isinstance(recipe_data, str):
-            if "```json" in recipe_data:
-                json_start = recipe_data.find("```json\n") + 8
-                json_end = recipe_data.rfind("```")
-                cleaned_json = recipe_data[json_start:json_end].strip()
-                try:
-                    recipe_data = json.loads(cleaned_json)
-                except json.JSONDecodeError:
-                    return jsonify({"error": f"Could not parse extracted JSON: {cleaned_json}"}), 500
-            else:
-                try:
-                    recipe_data = json.loads(recipe_data)
-                except json.JSONDecodeError:
-                    return jsonify({"error": f"Could not parse as JSON: {recipe_data}"}), 500
-        if not isinstance(recipe_data, dict):
-            return jsonify({"error": f"Unexpected output format: {type(recipe_data)}"}), 500
-        if 'ingredients' in recipe_data and 'items' not in recipe_data:
-            recipe_data['items'] = recipe_data.pop('ingredients')
-            
-        if 'steps' in recipe_data and 'instructions' not in recipe_data:
-            recipe_data['instructions'] = recipe_data.pop('steps')
-
+        recipe_data = generate_recipe(recipe_type, ingredients)
         recipe_data["is_recipe"] = True
         recipe_data["is_fav"] = False
         insert_result = recipes_collection.insert_one(recipe_data)
@@ -83,10 +60,23 @@ def get_recipes():
 
 @recipe_bp.route('/get-recipe-suggestions', methods=['GET'])
 def get_recipe_suggestions_route():
+    global _suggestions
     try:
-        ingredients = list(ingredients_collection.find())
-        suggestions = get_recipe_suggestions(ingredients)
-        return jsonify(suggestions)
+        version, ingredients = get_snapshot()
+        # Suggestions differ between workers for the same pantry, hence weak ETags
+        if pantry_not_modified(version):
+            return pantry_response(version, None, weak=True)
+
+        cached = _suggestions
+        if cached is None or cached[0] < version:
+            # Only one request per worker regenerates; the rest wait and reuse its result
+            with _suggestions_lock:
+                cached = _suggestions
+                if cached is None or cached[0] < version:
+                    cached = (version, get_recipe_suggestions(ingredients))
+                    _suggestions = cached
+        version, suggestions = cached
+        return pantry_response(version, suggestions, weak=True)
     except Exception as e:
         return jsonify({"error": f"Error generating suggestions: {str(e)}"}), 500
 